@@ -2,17 +2,43 @@
 import cv2
 import mss
 import numpy as np
+import sys
 import time
 import threading
-from queue import Queue, Full
 from abc import ABC, abstractmethod
-from utils import logger
+from utils import logger, FramePool, HighResolutionTimer, configure_current_thread
+
+try:
+    import dxcam # Optional: Windows Desktop Duplication capture
+except ImportError:
+    dxcam = None
+
+# Number of initial screen grabs used to measure the sustainable capture rate
+SCREEN_WARMUP_FRAMES = 30
+# Webcam decode buffers allocated up front: the frame slot, one in processing, the
+# results slot, one being drawn in place, the display slot, one on screen and the
+# one being decoded. A buffer is only reused once all of those have released it; the
+# pool grows if a slower pipeline holds more.
+WEBCAM_FRAME_BUFFERS = 8
 
 class BaseCapture(ABC):
-    """Abstract base class for different capture methods."""
-    def __init__(self, frame_queue):
+    """Abstract base class for different capture methods.
+
+    frame_queue is a LatestSlot: capture always overwrites the pending frame so
+    the consumer only ever sees the newest one. Frames are published as
+    (time.monotonic() timestamp, frame) tuples.
+    """
+    # Slots keep per-instance attribute access at fixed offsets in the capture loops
+    __slots__ = ('frame_queue', '_stop_event', '_capture_thread', 'width', 'height', 'fps',
+                 'cpu_affinity', 'thread_priority', 'ready_event')
+
+    def __init__(self, frame_queue, config):
         self.frame_queue = frame_queue
+        self.cpu_affinity = config['capture'].get('cpu_affinity')
+        self.thread_priority = config['capture'].get('thread_priority')
         self._stop_event = threading.Event()
+        # Set once width/height are known (or initialization gave up)
+        self.ready_event = threading.Event()
         self._capture_thread = None
         self.width = 0
         self.height = 0
@@ -23,6 +49,14 @@ class BaseCapture(ABC):
         """The main loop to capture frames and put them in the queue."""
         pass
 
+    def _run(self):
+        """Thread entry point: applies CPU affinity/priority, then runs the capture loop."""
+        configure_current_thread(self.cpu_affinity, self.thread_priority)
+        try:
+            self._capture_loop()
+        finally:
+            self.ready_event.set() # Never leave start-up waiting on a failed source
+
     def start(self):
         """Starts the capture thread."""
         if self._capture_thread is not None:
@@ -30,7 +64,8 @@ class BaseCapture(ABC):
             return
         logger.info(f"Starting capture thread for {self.__class__.__name__}...")
         self._stop_event.clear()
-        self._capture_thread = threading.Thread(target=self._capture_loop, name=f"{self.__class__.__name__}Thread")
+        self.ready_event.clear()
+        self._capture_thread = threading.Thread(target=self._run, name=f"{self.__class__.__name__}Thread")
         self._capture_thread.daemon = True # Ensure thread exits when main program exits
         self._capture_thread.start()
 
@@ -54,33 +89,78 @@ class BaseCapture(ABC):
 
 class WebcamCapture(BaseCapture):
     """Captures video from a webcam or UVC device like Elgato Neo."""
+    __slots__ = ('device_index', 'target_resolution', 'target_fps', 'backend', 'fourcc', 'cap', '_frame_ring')
+
     def __init__(self, frame_queue, config):
-        super().__init__(frame_queue)
+        super().__init__(frame_queue, config)
         self.device_index = config['capture']['device_index']
         self.target_resolution = tuple(config['capture'].get('resolution')) if config['capture'].get('resolution') else None
         self.target_fps = config['capture'].get('fps')
+        self.backend = self._resolve_backend(config['capture'].get('backend', 'auto'))
+        self.fourcc = config['capture'].get('fourcc', 'MJPG')
         self.cap = None
+        # Frames are decoded into a ring of reused buffers
+        self._frame_ring = FramePool(WEBCAM_FRAME_BUFFERS)
+
+    @staticmethod
+    def _resolve_backend(name):
+        """Maps the configured backend name to an OpenCV VideoCapture API id."""
+        name = (name or 'auto').lower()
+        if name == 'auto':
+            # Native backends deliver compressed formats like MJPG reliably
+            if sys.platform == 'win32':
+                return cv2.CAP_MSMF
+            if sys.platform.startswith('linux'):
+                return cv2.CAP_V4L2
+            return cv2.CAP_ANY
+        backends = {
+            'any': cv2.CAP_ANY,
+            'msmf': cv2.CAP_MSMF,
+            'dshow': cv2.CAP_DSHOW,
+            'v4l2': cv2.CAP_V4L2,
+        }
+        if name not in backends:
+            logger.warning(f"Unknown capture backend '{name}'. Using CAP_ANY.")
+        return backends.get(name, cv2.CAP_ANY)
+
+    def _open_params(self):
+        """Builds the VideoCapture open parameters so the device is configured in a single call."""
+        params = []
+        # Pixel format first; drivers apply resolution/FPS per format.
+        # MJPG cuts USB bandwidth versus raw YUY2 and is decoded by libjpeg-turbo.
+        if self.fourcc:
+            logger.info(f"Requesting pixel format {self.fourcc}")
+            params += [cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc), cv2.CAP_PROP_CONVERT_RGB, 1]
+        if self.target_resolution:
+            logger.info(f"Requesting resolution {self.target_resolution}")
+            params += [cv2.CAP_PROP_FRAME_WIDTH, int(self.target_resolution[0]),
+                       cv2.CAP_PROP_FRAME_HEIGHT, int(self.target_resolution[1])]
+        if self.target_fps:
+            logger.info(f"Requesting FPS {self.target_fps}")
+            params += [cv2.CAP_PROP_FPS, int(self.target_fps)]
+        return params
 
     def _capture_loop(self):
         try:
             logger.info(f"Initializing webcam/UVC device index: {self.device_index}")
-            self.cap = cv2.VideoCapture(self.device_index, cv2.CAP_ANY) # Use CAP_ANY or just omit the second arg
+            # Passing the properties at open time avoids the per-set() device re-initialisation
+            # some drivers (notably MSMF) perform, and the transient 0x0 size between set() calls
+            params = self._open_params()
+            self.cap = cv2.VideoCapture(self.device_index, self.backend, params)
+
+            if not self.cap.isOpened() and params:
+                # Open fails outright if the backend rejects any parameter, so retry
+                # plainly and apply the properties one by one as best effort
+                logger.warning("Device rejected open parameters, falling back to setting properties individually.")
+                self.cap.release()
+                self.cap = cv2.VideoCapture(self.device_index, self.backend)
+                for prop, value in zip(params[::2], params[1::2]):
+                    self.cap.set(prop, value)
 
             if not self.cap.isOpened():
                 logger.error(f"Failed to open video capture device {self.device_index}.")
-                self.cap.release()
                 return
 
-            # --- Configure Capture Properties ---
-            if self.target_resolution:
-                logger.info(f"Setting resolution to {self.target_resolution}")
-                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.target_resolution[0])
-                self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.target_resolution[1])
-
-            if self.target_fps:
-                logger.info(f"Setting FPS to {self.target_fps}")
-                self.cap.set(cv2.CAP_PROP_FPS, self.target_fps)
-
             # --- Read Actual Properties ---
             self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
             self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
@@ -89,11 +169,19 @@ class WebcamCapture(BaseCapture):
 
             if self.width == 0 or self.height == 0:
                  logger.error("Capture device reported zero resolution. Check device index or permissions.")
-                 self.cap.release()
-                 return
+                 return # Device is released in finally
+            self.ready_event.set()
 
-            while not self._stop_event.is_set():
-                ret, frame = self.cap.read()
+            # Bind hot-loop callables to locals to skip repeated attribute lookups
+            stopped = self._stop_event.is_set
+            read = self.cap.read
+            next_buffer = self._frame_ring.next_buffer
+            put = self.frame_queue.put
+            frame_shape = (self.height, self.width, 3)
+
+            while not stopped():
+                # Decode straight into a pre-allocated buffer no consumer still holds
+                ret, frame = read(next_buffer(frame_shape))
                 if not ret or frame is None:
                     logger.warning("Failed to grab frame or end of stream.")
                     time.sleep(0.1) # Avoid busy-waiting if stream ends or fails
@@ -101,20 +189,8 @@ class WebcamCapture(BaseCapture):
                     # For now, just break the loop
                     break
 
-                try:
-                    # Put the frame into the queue, overwriting oldest if full
-                    self.frame_queue.put_nowait((time.time(), frame))
-                except Full:
-                    # Queue is full, drop the oldest frame and put the new one
-                    try:
-                        self.frame_queue.get_nowait() # Discard oldest
-                        self.frame_queue.put_nowait((time.time(), frame)) # Add newest
-                        logger.debug("Frame queue full, dropped oldest frame.")
-                    except Exception as e_inner:
-                        # Handle potential race condition if queue becomes empty between get/put
-                        logger.warning(f"Error managing full queue: {e_inner}")
-                except Exception as e:
-                     logger.error(f"Error putting frame in queue: {e}")
+                # Publish the frame, replacing any frame not yet picked up
+                put((time.monotonic(), frame))
 
         except Exception as e:
             logger.error(f"Exception in Webcam capture loop: {e}", exc_info=True)
@@ -126,14 +202,20 @@ class WebcamCapture(BaseCapture):
 
 class ScreenCapture(BaseCapture):
     """Captures video from a screen region."""
+    __slots__ = ('monitor_number', 'region', 'target_fps', 'sct', 'monitor')
+
     def __init__(self, frame_queue, config):
-        super().__init__(frame_queue)
+        super().__init__(frame_queue, config)
         self.monitor_number = config['capture'].get('monitor', 1)
         self.region = config['capture'].get('region')
+        # Upper bound on the grab rate; None grabs as fast as the system sustains
+        self.target_fps = config['capture'].get('fps')
         self.sct = None
         self.monitor = None
 
     def _capture_loop(self):
+        # Pacing sleeps are a few ms, below the default Windows sleep granularity
+        timer = HighResolutionTimer()
         try:
             with mss.mss() as self.sct:
                 monitors = self.sct.monitors
@@ -162,44 +244,112 @@ class ScreenCapture(BaseCapture):
                     self.height = self.monitor["height"]
                     logger.info(f"Capturing full monitor {self.monitor_number}: {self.width}x{self.height}")
 
-                # Estimate FPS - mss doesn't provide a fixed FPS
-                self.fps = 60 # Assume 60 for now, could be measured
+                # mss doesn't provide a fixed FPS: pace to the configured cap until the
+                # sustainable rate has been measured over the warmup grabs
+                self.fps = self.target_fps or 0
                 logger.info(f"Screen capture started: {self.width}x{self.height} (Target FPS depends on system performance)")
+                self.ready_event.set()
+                # Frame periods in integer nanoseconds, computed once
+                cap_period_ns = int(1e9 / self.target_fps) if self.target_fps else 0
+                period_ns = cap_period_ns
+                warmup_count = 0
+                warmup_ns = 0
 
-                while not self._stop_event.is_set():
-                    start_time = time.perf_counter()
+                # Bind hot-loop callables to locals to skip repeated attribute lookups
+                stopped = self._stop_event.is_set
+                grab = self.sct.grab
+                put = self.frame_queue.put
+                perf_counter_ns = time.perf_counter_ns
+
+                while not stopped():
+                    start_ns = perf_counter_ns()
 
                     # Grab the screen
-                    sct_img = self.sct.grab(capture_region)
+                    sct_img = grab(capture_region)
 
                     if sct_img:
-                        # Convert to OpenCV format (BGRA to BGR)
-                        frame = np.array(sct_img)
-                        frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-
-                        try:
-                            self.frame_queue.put_nowait((time.time(), frame))
-                        except Full:
-                            try:
-                                self.frame_queue.get_nowait()
-                                self.frame_queue.put_nowait((time.time(), frame))
-                                logger.debug("Frame queue full, dropped oldest frame.")
-                            except Exception as e_inner:
-                                logger.warning(f"Error managing full queue: {e_inner}")
-                        except Exception as e:
-                            logger.error(f"Error putting frame in queue: {e}")
-
-                    # Control capture rate - aim for roughly 60 FPS max if possible
-                    elapsed = time.perf_counter() - start_time
-                    sleep_time = max(0, (1/self.fps) - elapsed)
-                    if sleep_time > 0:
-                        time.sleep(sleep_time)
+                        # Wrap the raw BGRA bytes without copying. mss hands out a
+                        # fresh buffer per grab, so the frame can be passed on as-is;
+                        # consumers ignore the alpha channel where they need BGR.
+                        frame = np.frombuffer(sct_img.raw, dtype=np.uint8).reshape(sct_img.height, sct_img.width, 4)
+
+                        put((time.monotonic(), frame))
+
+                    elapsed_ns = perf_counter_ns() - start_ns
+                    if warmup_count < SCREEN_WARMUP_FRAMES:
+                        warmup_count += 1
+                        warmup_ns += elapsed_ns
+                        if warmup_count == SCREEN_WARMUP_FRAMES:
+                            measured_ns = warmup_ns // SCREEN_WARMUP_FRAMES
+                            period_ns = max(measured_ns, cap_period_ns)
+                            self.fps = 1e9 / period_ns if period_ns > 0 else 0
+                            logger.info(f"Measured screen grab time {measured_ns / 1e6:.1f}ms, pacing at {self.fps:.1f} FPS")
+
+                    # Control capture rate - never faster than the configured cap
+                    sleep_ns = period_ns - elapsed_ns
+                    if sleep_ns > 0:
+                        timer.sleep_ns(sleep_ns)
 
         except Exception as e:
             logger.error(f"Exception in Screen capture loop: {e}", exc_info=True)
         finally:
+             timer.close()
              logger.info("Screen capture resources released.")
 
+
+class DXGICapture(BaseCapture):
+    """Captures a screen region via the Windows Desktop Duplication API (dxcam)."""
+    __slots__ = ('output_index', 'region', 'target_fps', 'camera')
+
+    def __init__(self, frame_queue, config):
+        super().__init__(frame_queue, config)
+        # mss numbers monitors from 1, DXGI outputs from 0
+        self.output_index = config['capture'].get('monitor', 1) - 1
+        self.region = config['capture'].get('region')
+        self.target_fps = config['capture'].get('fps') or 60
+        # Created here rather than in the capture thread so a failure (e.g. on some
+        # hybrid-GPU laptops) surfaces in get_capture_source, which falls back to mss
+        # BGRA is the native duplication format, so dxcam skips any colour conversion
+        self.camera = dxcam.create(output_idx=self.output_index, output_color='BGRA')
+        if self.camera is None:
+            raise RuntimeError(f"dxcam could not create a capture for output {self.output_index}")
+
+    def _capture_loop(self):
+        try:
+            region = None
+            if self.region:
+                # dxcam expects (left, top, right, bottom) relative to the output
+                left, top, width, height = self.region
+                region = (left, top, left + width, top + height)
+                self.width, self.height = width, height
+                logger.info(f"Capturing region {self.region} on output {self.output_index}")
+            else:
+                self.width, self.height = self.camera.width, self.camera.height
+                logger.info(f"Capturing full output {self.output_index}: {self.width}x{self.height}")
+            self.fps = self.target_fps
+
+            self.camera.start(region=region, target_fps=self.target_fps, video_mode=True)
+            logger.info(f"DXGI capture started: {self.width}x{self.height} @ {self.fps} FPS target")
+            self.ready_event.set()
+
+            # Bind hot-loop callables to locals to skip repeated attribute lookups
+            stopped = self._stop_event.is_set
+            get_latest_frame = self.camera.get_latest_frame
+            put = self.frame_queue.put
+
+            while not stopped():
+                # Blocks until the duplication API delivers a new frame
+                frame = get_latest_frame()
+                if frame is not None:
+                    put((time.monotonic(), frame))
+
+        except Exception as e:
+            logger.error(f"Exception in DXGI capture loop: {e}", exc_info=True)
+        finally:
+            if self.camera is not None:
+                self.camera.stop()
+                logger.info("DXGI capture resources released.")
+
 def get_capture_source(config, frame_queue):
     """Factory function to create the appropriate capture source based on config."""
     capture_type = config.get('capture', {}).get('type', 'webcam').lower()
@@ -209,6 +359,18 @@ def get_capture_source(config, frame_queue):
         # Treat Elgato Neo as a UVC webcam
         return WebcamCapture(frame_queue, config)
     elif capture_type == 'screen':
+        backend = (config['capture'].get('screen_backend') or 'auto').lower()
+        if backend in ('auto', 'dxgi'):
+            # Prefer Desktop Duplication on Windows when dxcam is installed
+            if sys.platform == 'win32' and dxcam is not None:
+                try:
+                    return DXGICapture(frame_queue, config)
+                except Exception as e:
+                    logger.warning(f"Desktop Duplication capture unavailable ({e}). Falling back to mss.")
+            elif backend == 'dxgi':
+                logger.warning("screen_backend 'dxgi' requires Windows and the dxcam package. Falling back to mss.")
+        elif backend != 'mss':
+            logger.warning(f"Unknown screen_backend '{backend}'. Using mss.")
         return ScreenCapture(frame_queue, config)
     else:
         logger.error(f"Unsupported capture type: {capture_type}. Defaulting to webcam.")
@@ -1,23 +1,32 @@
 import cv2
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+def _probe_index(index):
+    """Opens a single camera index and returns (index, width, height) if it works, else None."""
+    cap = cv2.VideoCapture(index, cv2.CAP_ANY) # Or just cv2.VideoCapture(index)
+    if cap is not None and cap.isOpened():
+        width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+        height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        cap.release()
+        return index, int(width), int(height)
+    if cap is not None:
+        cap.release()
+    return None
 
 def list_available_cameras(max_test=10):
     """Tries to open camera indices and lists the ones that work."""
     available_indices = []
     print(f"Scanning for available camera devices (indices 0 to {max_test - 1})...")
-    for i in range(max_test):
-        cap = cv2.VideoCapture(i, cv2.CAP_ANY) # Or just cv2.VideoCapture(i)
-        if cap is not None and cap.isOpened():
-            width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
-            height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
-            print(f"  Index {i}: Found - Resolution {int(width)}x{int(height)}")
+    # Probing is dominated by driver calls that can take seconds to fail, so probe all indices concurrently
+    with ThreadPoolExecutor(max_workers=max_test) as executor:
+        results = list(executor.map(_probe_index, range(max_test)))
+    for result in results:
+        if result is not None:
+            i, width, height = result
+            print(f"  Index {i}: Found - Resolution {width}x{height}")
             available_indices.append(i)
-            cap.release()
-        else:
-             # Optional: print(f"  Index {i}: Not available or failed to open.")
-             if cap is not None:
-                cap.release()
     print("-" * 30)
     if not available_indices:
         print("No camera devices found.")
@@ -1,14 +1,23 @@
 # main.py
-import time
 import threading
-from queue import Queue, Empty
 import sys
 
-from utils import logger, load_config
+from utils import logger, load_config, configure_opencv, LatestSlot, RateLimiter
 from capture import get_capture_source
 from processing import AIProcessor
 from overlay import OverlayRenderer
 
+# Upper bound on how long start-up waits for the capture source to initialize
+CAPTURE_READY_TIMEOUT = 5.0
+
+def watch_thread(thread, name, results_queue, shutdown_event):
+    """Blocks until a worker thread exits and wakes the main loop if it died before shutdown."""
+    if thread is not None:
+        thread.join()
+    if not shutdown_event.is_set():
+        logger.error(f"{name} thread has stopped unexpectedly. Exiting.")
+        results_queue.close() # Unblocks the main loop with None
+
 def main():
     # Load configuration
     config = load_config()
@@ -16,13 +25,14 @@ def main():
         logger.error("Failed to load configuration. Exiting.")
         sys.exit(1)
 
-    # Create shared queues
-    # Queue for raw frames from capture to processing
-    frame_queue_size = config.get('frame_queue_size', 2)
-    frame_queue = Queue(maxsize=frame_queue_size)
-    # Queue for processed results (frame + detections) from processing to display
-    # Make this queue slightly larger to handle potential display fluctuations
-    results_queue = Queue(maxsize=frame_queue_size + 2)
+    configure_opencv(config.get('opencv_threads'))
+
+    # Create shared single-slot buffers; each stage only ever sees the newest item,
+    # so a slow consumer drops stale data instead of accumulating latency
+    # Raw frames from capture to processing
+    frame_queue = LatestSlot()
+    # Processed results (frame + detections) from processing to display
+    results_queue = LatestSlot()
 
     # --- Initialize Modules ---
     # Capture Module (runs in its own thread)
@@ -35,7 +45,7 @@ def main():
         sys.exit(1)
     ai_processor = AIProcessor(frame_queue, results_queue, config)
 
-    # Overlay and Output Module (runs in the main thread)
+    # Overlay and Output Module (draws in the main thread, displays in its own thread)
     # Ensure output config exists
     if 'output' not in config:
         logger.error("'output' section missing in config.yaml. Exiting.")
@@ -44,51 +54,56 @@ def main():
 
     # --- Start Threads ---
     capture_source.start()
-    # Give capture a moment to initialize and report properties
-    time.sleep(1)
+    # Wait until capture has initialized and knows its properties
+    if not capture_source.ready_event.wait(timeout=CAPTURE_READY_TIMEOUT):
+        logger.warning(f"Capture source not ready after {CAPTURE_READY_TIMEOUT:.0f}s.")
     width, height, fps = capture_source.get_properties()
     if width == 0 or height == 0:
          logger.warning("Capture source failed to provide valid dimensions. Trying to continue...")
          # Attempt to start processor anyway, might fail later
     ai_processor.start()
+    if not ai_processor._processing_threads:
+        # No worker means nothing would ever reach results_queue; fail instead of waiting forever
+        logger.error("AI processing did not start (model failed to load?). Exiting.")
+        capture_source.stop()
+        sys.exit(1)
 
+    # Watchdogs replace periodic liveness polling: a dead worker wakes the main loop immediately
+    shutdown_event = threading.Event()
+    workers = [(capture_source._capture_thread, "Capture")]
+    workers += [(thread, "Processing") for thread in ai_processor._processing_threads]
+    for thread, name in workers:
+        threading.Thread(target=watch_thread, args=(thread, name, results_queue, shutdown_event),
+                         name=f"{name}Watchdog", daemon=True).start()
+
+    # The display thread closes the results slot on 'q', which ends the main loop
+    overlay_renderer.start(on_exit=results_queue.close)
+
+    warn_limiter = RateLimiter(1.0) # Per-frame warnings at most once per second
     logger.info("Main loop starting. Press 'q' in the output window to exit.")
     # --- Main Display Loop ---
     try:
         while True:
-            # Get the latest processed result
-            try:
-                result_data = results_queue.get(timeout=0.5) # Wait up to 500ms for a result
-            except Empty:
-                # No new results, maybe check if threads are alive or just continue
-                if not capture_source._capture_thread.is_alive():
-                    logger.error("Capture thread has stopped unexpectedly. Exiting.")
-                    break
-                if not ai_processor._processing_thread.is_alive():
-                     logger.error("Processing thread has stopped unexpectedly. Exiting.")
-                     break
-                logger.debug("No results in queue, waiting...")
-                continue
-            except Exception as e:
-                 logger.error(f"Error getting results from queue: {e}")
-                 break
+            # Block until the next processed result; None means the slot was closed
+            # by a watchdog or the display thread
+            result_data = results_queue.get()
+            if result_data is None:
+                break
 
             # Extract frame and detections
-            frame = result_data.get('frame')
-            detections = result_data.get('detections', [])
+            frame = result_data.frame
+            detections = result_data.detections
 
             if frame is None:
-                logger.warning("Received None frame in main loop. Skipping display.")
+                if warn_limiter.ready():
+                    logger.warning("Received None frame in main loop. Skipping display.")
                 continue
 
             # Draw overlays
             display_frame = overlay_renderer.draw_overlays(frame, detections)
 
-            # Display the frame
-            overlay_renderer.display_frame(display_frame)
-
-            # Check for exit key
-            if overlay_renderer.check_exit_key(delay_ms=1): # Small delay for UI responsiveness
+            # Hand off for display; only reports 'q' when displaying inline (macOS)
+            if overlay_renderer.show(display_frame):
                 logger.info("'q' pressed, initiating shutdown.")
                 break
 
@@ -99,6 +114,7 @@ def main():
     finally:
         # --- Cleanup ---
         logger.info("Shutting down threads and resources...")
+        shutdown_event.set() # Expected exits from here on; silences the watchdogs
         capture_source.stop()
         ai_processor.stop()
         overlay_renderer.cleanup()
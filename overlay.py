@@ -1,6 +1,115 @@
 # overlay.py
+import sys
+import ctypes
+import threading
 import cv2
-from utils import logger, FPSCounter
+import numpy as np
+from queue import Empty
+from utils import logger, FPSCounter, LatestSlot, RateLimiter, FramePool
+
+# Optional PySDL2 display backend, imported only when selected (_load_sdl2): importing
+# it loads the SDL library, and pysdl2-dll warns on every import
+sdl2 = None
+
+def _load_sdl2():
+    """Imports PySDL2 on first use; returns False if it is not installed."""
+    global sdl2
+    if sdl2 is None:
+        try:
+            import sdl2 as sdl2_module
+        except ImportError:
+            return False
+        sdl2 = sdl2_module
+    return True
+
+# Above this display rate, waitKey's 1 ms minimum sleep becomes a significant
+# share of each frame, so keys are polled without sleeping instead
+POLL_KEY_FPS_THRESHOLD = 100
+# Drawing buffers allocated up front: one being drawn, one waiting in the display slot
+# and one being shown. A buffer is only redrawn once the display thread has finished
+# with it; the pool grows if the display falls further behind.
+DISPLAY_BUFFERS = 3
+# Upper bound on cached label strings/sizes; the oldest entry is evicted first
+LABEL_CACHE_SIZE = 1024
+# Pre-formatted confidence text for each hundredth from 0.00 to 1.00
+CONFIDENCE_TEXT = [f"{i / 100:.2f}" for i in range(101)]
+
+def _opencv_has_opengl():
+    """Returns True if this OpenCV build reports OpenGL support for HighGUI windows."""
+    for line in cv2.getBuildInformation().splitlines():
+        if line.strip().startswith('OpenGL support:'):
+            return 'YES' in line
+    return False
+
+class SDLDisplay:
+    """Presents frames through an SDL2 streaming texture instead of HighGUI.
+
+    Uploads each BGR/BGRA frame with SDL_UpdateTexture and polls events without
+    the mandatory sleep of cv2.waitKey. All methods must be called from the
+    thread that called open().
+    """
+    def __init__(self, title):
+        self.title = title.encode('utf-8')
+        self.window = None
+        self.renderer = None
+        self.texture = None
+        self._texture_shape = None
+        self._event = sdl2.SDL_Event()
+
+    def open(self):
+        """Creates the SDL window and renderer."""
+        if sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO) != 0:
+            raise RuntimeError(f"SDL_Init failed: {sdl2.SDL_GetError().decode()}")
+        self.window = sdl2.SDL_CreateWindow(self.title, sdl2.SDL_WINDOWPOS_CENTERED, sdl2.SDL_WINDOWPOS_CENTERED,
+                                            640, 480, sdl2.SDL_WINDOW_SHOWN)
+        # No SDL_RENDERER_PRESENTVSYNC: presenting must never block the display thread
+        self.renderer = sdl2.SDL_CreateRenderer(self.window, -1, sdl2.SDL_RENDERER_ACCELERATED)
+        if not self.window or not self.renderer:
+            raise RuntimeError(f"Failed to create SDL window: {sdl2.SDL_GetError().decode()}")
+        logger.info("Created SDL display window.")
+
+    def display_frame(self, frame):
+        """Uploads a BGR or BGRA frame into the streaming texture and presents it."""
+        if isinstance(frame, cv2.UMat):
+            frame = frame.get()
+        height, width, channels = frame.shape
+        if self._texture_shape != frame.shape:
+            # (Re)create the texture and size the window when the frame geometry changes
+            if self.texture:
+                sdl2.SDL_DestroyTexture(self.texture)
+            # ARGB8888 is stored as B, G, R, A bytes on little-endian hosts
+            pixel_format = sdl2.SDL_PIXELFORMAT_BGR24 if channels == 3 else sdl2.SDL_PIXELFORMAT_ARGB8888
+            self.texture = sdl2.SDL_CreateTexture(self.renderer, pixel_format, sdl2.SDL_TEXTUREACCESS_STREAMING,
+                                                  width, height)
+            sdl2.SDL_SetWindowSize(self.window, width, height)
+            self._texture_shape = frame.shape
+        if frame.strides[1:] != (channels, 1):
+            frame = np.ascontiguousarray(frame) # Rows may be padded, pixels must be packed
+        sdl2.SDL_UpdateTexture(self.texture, None, ctypes.c_void_p(frame.ctypes.data), frame.strides[0])
+        sdl2.SDL_RenderCopy(self.renderer, self.texture, None, None)
+        sdl2.SDL_RenderPresent(self.renderer)
+
+    def check_exit_key(self):
+        """Drains pending window events and returns True on 'q' or window close."""
+        event = self._event
+        while sdl2.SDL_PollEvent(ctypes.byref(event)):
+            if event.type == sdl2.SDL_QUIT:
+                return True
+            if event.type == sdl2.SDL_KEYDOWN and event.key.keysym.sym == sdl2.SDLK_q:
+                return True
+        return False
+
+    def close(self):
+        """Destroys the SDL texture, renderer and window."""
+        if self.texture:
+            sdl2.SDL_DestroyTexture(self.texture)
+        if self.renderer:
+            sdl2.SDL_DestroyRenderer(self.renderer)
+        if self.window:
+            sdl2.SDL_DestroyWindow(self.window)
+        self.texture = self.renderer = self.window = None
+        sdl2.SDL_Quit()
+
 
 class OverlayRenderer:
     """Handles drawing overlays onto frames and displaying the result."""
@@ -8,7 +117,32 @@ class OverlayRenderer:
         self.config = config['output']
         self.show_fps = self.config.get('show_fps', True)
         self.window_title = self.config.get('window_title', 'ESP Overlay')
+        # Present frames through an OpenGL texture instead of a software-rendered window
+        self.opengl_window = self.config.get('opengl_window', True)
+        # 'opencv' (HighGUI) or 'sdl' (PySDL2)
+        self._sdl = None
+        if self.config.get('display_backend', 'opencv').lower() == 'sdl':
+            if _load_sdl2():
+                self._sdl = SDLDisplay(self.window_title)
+            else:
+                logger.warning("display_backend 'sdl' requested, but PySDL2 is not installed. Using OpenCV.")
+        # Draw straight onto the frame handed in, which the caller then gives up
+        self.draw_inplace = self.config.get('draw_inplace', True)
+        # Draw into an OpenCL-backed cv2.UMat so OpenCV can keep the frame on the GPU
+        self.use_umat = self.config.get('use_umat', False)
+        if self.use_umat:
+            if cv2.ocl.haveOpenCL():
+                cv2.ocl.setUseOpenCL(True)
+                logger.info("Drawing overlays into OpenCL UMat buffers.")
+            else:
+                logger.warning("use_umat requested, but OpenCL is not available. Drawing on the CPU.")
+                self.use_umat = False
         self.fps_counter = FPSCounter()
+        # FPS text is only re-formatted when the counter publishes a new value
+        self._fps_value = None
+        self._fps_text = ""
+        # Per-frame warnings are emitted at most once per second
+        self._warn_limiter = RateLimiter(1.0)
 
         # Basic color definitions (BGR format)
         self.colors = {
@@ -21,64 +155,226 @@ class OverlayRenderer:
         self.default_box_color = self.colors['red']
         self.default_text_color = self.colors['white']
 
+        # (class_id, confidence in hundredths) -> (label, (text_width, text_height), baseline)
+        self._label_cache = {}
+
+        # Frames are drawn into recycled buffers instead of a fresh copy per frame; a
+        # buffer still referenced by the display slot or thread is never handed out
+        self._draw_ring = FramePool(DISPLAY_BUFFERS)
+
+        # Drawn frames handed from the main thread to the display thread
+        self._display_slot = LatestSlot()
+        self._display_thread = None
+        self._on_exit = None
+
+    def start(self, on_exit):
+        """Starts the display thread, which calls on_exit when 'q' is pressed or it fails.
+
+        On macOS HighGUI must run on the main thread, so show() displays inline instead.
+        """
+        if sys.platform == 'darwin':
+            logger.info("Display runs on the main thread on macOS.")
+            self._create_window()
+            return
+        self._on_exit = on_exit
+        self._display_thread = threading.Thread(target=self._display_loop, name="DisplayThread", daemon=True)
+        self._display_thread.start()
+        logger.info("Display thread started.")
+
+    def show(self, frame):
+        """Hands a drawn frame to the display. Returns True if 'q' was pressed (inline mode only)."""
+        if self._display_thread is None:
+            self.display_frame(frame)
+            return self.check_exit_key(delay_ms=1)
+        self._display_slot.put(frame)
+        return False
+
+    def _create_window(self):
+        """Creates the output window on the calling thread, OpenGL-backed when the build supports it."""
+        if self._sdl is not None:
+            self._sdl.open()
+            return
+        if self.opengl_window:
+            if _opencv_has_opengl():
+                try:
+                    cv2.namedWindow(self.window_title, cv2.WINDOW_OPENGL | cv2.WINDOW_AUTOSIZE)
+                    logger.info("Created OpenGL display window.")
+                    return
+                except cv2.error as e:
+                    logger.warning(f"Could not create OpenGL window ({e}). Using the default window.")
+            else:
+                logger.info("OpenCV was built without OpenGL support. Using the default window.")
+        cv2.namedWindow(self.window_title, cv2.WINDOW_AUTOSIZE)
+
+    def _display_loop(self):
+        """Shows the newest drawn frame and pumps window events until stopped or 'q' is pressed."""
+        try:
+            # The window must belong to the thread that pumps its events
+            self._create_window()
+            while True:
+                try:
+                    # Timed get keeps the window responsive while no new frames arrive
+                    frame = self._display_slot.get(timeout=0.1)
+                except Empty:
+                    frame = None
+                else:
+                    if frame is None: # Slot closed by cleanup()
+                        break
+                    self.display_frame(frame)
+                if self.check_exit_key(delay_ms=1):
+                    logger.info("'q' pressed, initiating shutdown.")
+                    break
+        except Exception as e:
+            logger.error(f"Error in display loop: {e}", exc_info=True)
+        finally:
+            # Windows belong to the thread that created them
+            self._destroy_window()
+            self._on_exit()
+
+    def _destroy_window(self):
+        """Closes the output window on the thread that created it."""
+        if self._sdl is not None:
+            self._sdl.close()
+        else:
+            cv2.destroyAllWindows()
+
     def draw_overlays(self, frame, detections):
-        """Draws bounding boxes and info for detected objects."""
+        """Draws bounding boxes and info for the detected objects (a processing.Detections).
+
+        With draw_inplace the frame itself is drawn on and returned, so the caller
+        must not use it afterwards; otherwise a recycled drawing buffer is used.
+        """
         if frame is None:
             return None
 
-        display_frame = frame.copy()
+        if not len(detections) and not self.show_fps:
+            # Nothing to draw: show the frame as-is without copying it
+            self.fps_counter.update() # check_exit_key still uses the display rate
+            return frame
 
-        for det in detections:
-            try:
-                bbox = det['bbox'] # [x_min, y_min, x_max, y_max]
-                confidence = det['confidence']
-                class_id = det['class_id']
+        if self.use_umat:
+            # Uploading into the UMat replaces the host-side copy
+            return self._draw(cv2.UMat(frame), detections)
+        if self.draw_inplace and frame.flags.writeable:
+            return self.draw_overlays_into(frame, frame, detections)
+        return self.draw_overlays_into(frame, self._draw_ring.next_buffer(frame.shape[:2] + (3,)), detections)
 
-                x1, y1, x2, y2 = map(int, bbox)
+    def draw_overlays_into(self, frame, dst, detections):
+        """Copies frame into the caller-supplied BGR buffer dst, draws on it and returns dst."""
+        if dst is not frame:
+            # Copy only the colour channels; this strips the alpha channel of
+            # BGRA screen frames as part of the copy
+            np.copyto(dst, frame[:, :, :3])
+        return self._draw(dst, detections)
 
-                # Draw bounding box
-                cv2.rectangle(display_frame, (x1, y1), (x2, y2), self.default_box_color, 2)
+    @staticmethod
+    def _draw_rects(display_frame, rects, color, thickness):
+        """Draws (N, 4) int32 [x1, y1, x2, y2] rectangles in one call; FILLED thickness fills them."""
+        if isinstance(display_frame, cv2.UMat):
+            # The Python polylines/fillPoly bindings reject UMat images; draw one by one
+            for x1, y1, x2, y2 in rects.tolist():
+                cv2.rectangle(display_frame, (x1, y1), (x2, y2), color, thickness)
+            return
+        # Rectangles as closed 4-corner polygons
+        corners = rects[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+        if thickness == cv2.FILLED:
+            cv2.fillPoly(display_frame, corners, color)
+        else:
+            cv2.polylines(display_frame, corners, True, color, thickness)
+
+    def _draw(self, display_frame, detections):
+        """Draws boxes, labels and the FPS counter onto display_frame (ndarray or UMat)."""
+        if len(detections):
+            bboxes = detections.bboxes
+            self._draw_rects(display_frame, bboxes, self.default_box_color, 2)
 
-                # Prepare label text
-                # TODO: Map class_id to label name if available
-                label = f"ID:{class_id} {confidence:.2f}"
+            # Label text and size depend only on class and rounded confidence,
+            # so format and measure each combination once
+            label_cache = self._label_cache
+            labels = []
+            sizes = []
+            append_label = labels.append
+            append_size = sizes.append
+            for confidence, class_id in zip(detections.confidences.tolist(), detections.class_ids.tolist()):
+                key = (class_id, min(int(confidence * 100 + 0.5), 100))
+                cached = label_cache.get(key)
+                if cached is None:
+                    # TODO: Map class_id to label name if available
+                    label = f"ID:{class_id} {CONFIDENCE_TEXT[key[1]]}"
+                    (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+                    cached = (label, (text_width, text_height, baseline))
+                    if len(label_cache) >= LABEL_CACHE_SIZE:
+                        del label_cache[next(iter(label_cache))]
+                    label_cache[key] = cached
+                append_label(cached[0])
+                append_size(cached[1])
+            text_width, text_height, baseline = np.array(sizes, dtype=np.int32).T
 
-                # Calculate text size and position
-                (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-                text_x = x1
-                text_y = y1 - 10 # Position text above the box
-                if text_y < 10: # If too close to top edge, put below box
-                    text_y = y2 + text_height + 5
+            # Text positions for all labels at once: above the box, or below it
+            # when too close to the top edge
+            text_x = bboxes[:, 0]
+            text_y = bboxes[:, 1] - 10
+            below = text_y < 10
+            text_y[below] = bboxes[below, 3] + text_height[below] + 5
 
-                # Draw background rectangle for text for better visibility
-                cv2.rectangle(display_frame, (text_x, text_y - text_height - baseline), (text_x + text_width, text_y + baseline), self.colors['black'], cv2.FILLED)
-                # Draw label text
-                cv2.putText(display_frame, label, (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, self.default_text_color, 1, cv2.LINE_AA)
+            # Background rectangles for better visibility, drawn together
+            backgrounds = np.stack((text_x, text_y - text_height - baseline,
+                                    text_x + text_width, text_y + baseline), axis=1)
+            self._draw_rects(display_frame, backgrounds, self.colors['black'], cv2.FILLED)
 
-            except Exception as e:
-                logger.error(f"Error drawing detection {det}: {e}", exc_info=False) # Avoid excessive logging
+            # Label text has no batch API and is drawn one by one.
+            # Bind the callable and constants to locals to skip repeated attribute lookups
+            put_text = cv2.putText
+            font = cv2.FONT_HERSHEY_SIMPLEX
+            # Plain 8-connected text is much cheaper than anti-aliased and looks the
+            # same at label size; only the FPS counter keeps LINE_AA
+            line_type = cv2.LINE_8
+            text_color = self.default_text_color
+            for label, x, y in zip(labels, text_x.tolist(), text_y.tolist()):
+                put_text(display_frame, label, (x, y), font, 0.5, text_color, 1, line_type)
+
+        # Track the display rate even when it is not shown; check_exit_key uses it
+        fps = self.fps_counter.update()
 
         # Draw FPS counter
         if self.show_fps:
-            fps = self.fps_counter.update() # Update FPS based on display rate
-            fps_text = f"FPS: {fps:.2f}"
-            cv2.putText(display_frame, fps_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, self.colors['green'], 2, cv2.LINE_AA)
+            if fps != self._fps_value:
+                self._fps_value = fps
+                self._fps_text = f"FPS: {fps:.2f}"
+            cv2.putText(display_frame, self._fps_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, self.colors['green'], 2, cv2.LINE_AA)
 
         return display_frame
 
     def display_frame(self, frame):
-        """Displays the frame in an OpenCV window."""
+        """Displays the frame in the output window."""
         if frame is not None:
-            cv2.imshow(self.window_title, frame)
-        else:
+            if self._sdl is not None:
+                self._sdl.display_frame(frame)
+            else:
+                cv2.imshow(self.window_title, frame)
+        elif self._warn_limiter.ready():
             logger.warning("Attempted to display a None frame.")
 
     def check_exit_key(self, delay_ms=1):
-        """Waits for a key press and returns True if 'q' is pressed."""
-        key = cv2.waitKey(delay_ms) & 0xFF
+        """Pumps window events and returns True if 'q' is pressed.
+
+        Call once per displayed frame. At high display rates this uses the
+        non-blocking cv2.pollKey() instead of sleeping delay_ms in cv2.waitKey().
+        """
+        if self._sdl is not None:
+            return self._sdl.check_exit_key()
+        if self.fps_counter.get_fps() > POLL_KEY_FPS_THRESHOLD:
+            key = cv2.pollKey() & 0xFF
+        else:
+            key = cv2.waitKey(delay_ms) & 0xFF
         return key == ord('q')
 
     def cleanup(self):
-        """Closes OpenCV display windows."""
+        """Stops the display thread, if any, and closes OpenCV display windows."""
         logger.info("Closing display windows.")
-        cv2.destroyAllWindows() 
\ No newline at end of file
+        if self._display_thread is not None:
+            self._display_slot.close()
+            self._display_thread.join(timeout=2.0) # The thread destroys its own windows
+            self._display_thread = None
+        else:
+            self._destroy_window() 
\ No newline at end of file
@@ -3,10 +3,79 @@ import onnxruntime as ort
 import numpy as np
 import time
 import threading
-from queue import Queue, Empty
-from utils import logger
+import logging
+from utils import logger, RateLimiter, configure_current_thread
 import cv2 # Needed for preprocessing/NMS if not handled by model directly
 
+try:
+    import cupy # Optional: device-side candidate filtering with the CUDA provider
+except ImportError:
+    cupy = None
+
+# Input size assumed when the model declares symbolic height/width
+DEFAULT_INPUT_SIZE = 640
+# Pixel normalisation factor, applied as a float32 multiply instead of a per-frame divide
+INV_255 = np.float32(1 / 255)
+# Normalised float16 value of every uint8 level; a gather through it replaces the
+# float16 multiply-and-cast (same rounding as the float32 multiply path)
+U8_TO_F16 = (np.arange(256, dtype=np.float32) * INV_255).astype(np.float16)
+# ONNX input element types supported by preprocessing
+INPUT_DTYPES = {
+    'tensor(float16)': np.float16,
+    'tensor(float)': np.float32,
+    'tensor(uint8)': np.uint8, # e.g. quantized models that scale inside the graph
+}
+
+class FrameResult:
+    """One processed frame: the original frame plus its detections.
+
+    Uses __slots__ so the per-frame object is cheap to build and read compared
+    to a dict.
+    """
+    __slots__ = ('timestamp', 'frame', 'detections')
+
+    def __init__(self, timestamp, frame, detections):
+        self.timestamp = timestamp
+        self.frame = frame
+        self.detections = detections
+
+
+class Detections:
+    """Detections for one frame as parallel arrays (structure of arrays).
+
+    bboxes is (N, 4) int32 [x_min, y_min, x_max, y_max] in frame pixels,
+    confidences (N,) float32 and class_ids (N,) int32. Consumers work on the
+    arrays directly instead of unpacking a dict per detection.
+    """
+    __slots__ = ('bboxes', 'confidences', 'class_ids')
+
+    def __init__(self, bboxes, confidences, class_ids):
+        self.bboxes = bboxes
+        self.confidences = confidences
+        self.class_ids = class_ids
+
+    def __len__(self):
+        return len(self.class_ids)
+
+
+# Shared result for frames without detections; never modified
+NO_DETECTIONS = Detections(np.empty((0, 4), dtype=np.int32), np.empty(0, dtype=np.float32),
+                           np.empty(0, dtype=np.int32))
+
+
+class _WorkerBuffers:
+    """One processing thread's reusable buffers, so concurrent workers never share them."""
+    __slots__ = ('input_tensor', 'canvas', 'canvas_geometry', 'io_binding', 'input_ort')
+
+    def __init__(self, input_tensor, io_binding):
+        self.input_tensor = input_tensor
+        # Letterbox canvas: the frame is resized into its centre, the border stays 114
+        self.canvas = None
+        self.canvas_geometry = None
+        self.io_binding = io_binding
+        self.input_ort = None
+
+
 class AIProcessor:
     """Handles AI model inference in a separate thread."""
     def __init__(self, frame_queue, results_queue, config):
@@ -14,207 +83,423 @@ class AIProcessor:
         self.results_queue = results_queue
         self.config = config['ai']
         self.use_gpu = config.get('use_gpu', False)
+        self.gpu_device_id = self.config.get('gpu_device_id', 0)
+        # Postprocessing settings, resolved once instead of looked up per frame
+        self._conf_thres = float(self.config['confidence_threshold'])
+        self._nms_thres = float(self.config['nms_threshold'])
+        classes_to_detect = self.config.get('classes_to_detect')
+        self._classes = np.asarray(classes_to_detect, dtype=np.intp) if classes_to_detect else None
+        # The class ids are validated against the model on its first output
+        self._classes_checked = False
+        # Upper bound on candidates passed on after the confidence filter (None: no cap)
+        max_candidates = self.config.get('max_candidates')
+        self._max_candidates = int(max_candidates) if max_candidates else None
+        self.cpu_affinity = self.config.get('cpu_affinity')
+        self.thread_priority = self.config.get('thread_priority')
+        # ORT intra-op pool size; defaults to the number of pinned cores, if any
+        self.intra_op_threads = self.config.get('intra_op_threads') or (len(self.cpu_affinity) if self.cpu_affinity else None)
+
+        # Threads that each run the whole preprocess/infer/postprocess pipeline on
+        # their own frame, sharing one (thread-safe) InferenceSession
+        self.num_workers = max(1, int(self.config.get('pipeline_workers') or 1))
 
         self._stop_event = threading.Event()
-        self._processing_thread = None
+        self._processing_threads = []
+        # With several workers results can finish out of order; only newer frames are published
+        self._publish_lock = threading.Lock()
+        self._last_published = float('-inf')
+        # Per-frame warnings/errors are emitted at most once per second
+        self._warn_limiter = RateLimiter(1.0)
 
         self.session = None
         self.input_name = None
         self.input_shape = None # Expected input shape (batch, height, width, channels)
+        # Model input height/width as ints, resolved once at load time
+        self.model_h = None
+        self.model_w = None
+        self.input_dtype = np.float16
+
+        # CUDA only: inputs/outputs bound to device buffers reused across frames
+        self.use_io_binding = False
+        # Filter candidates on the GPU (CuPy) so only they are downloaded, not the full output
+        self.gpu_prefilter = False
 
         self._load_model()
 
     def _load_model(self):
         """Loads the ONNX model and prepares the inference session."""
         model_path = self.config['model_path']
+        if self.config.get('precision') == 'int8':
+            if self.config.get('int8_model_path'):
+                model_path = self.config['int8_model_path']
+            else:
+                logger.warning("precision is 'int8' but int8_model_path is not set. Using model_path.")
         logger.info(f"Loading ONNX model from: {model_path}")
         try:
             providers = ort.get_available_providers()
             logger.info(f"Available ONNX Runtime providers: {providers}")
-            provider_options = []
+            sess_options = ort.SessionOptions()
+            sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            if self.intra_op_threads:
+                # Pool size counts the calling worker, so ORT starts intra_op_threads - 1 threads
+                sess_options.intra_op_num_threads = int(self.intra_op_threads)
+                if self.cpu_affinity and sess_options.intra_op_num_threads > 1:
+                    # The pool threads are created here, on the unpinned main thread, and do
+                    # not inherit the workers' pinning; pin each to the processing cores.
+                    # ORT numbers logical processors from 1
+                    cores = ','.join(str(core + 1) for core in sorted(set(self.cpu_affinity)))
+                    sess_options.add_session_config_entry(
+                        'session.intra_op_thread_affinities',
+                        ';'.join([cores] * (sess_options.intra_op_num_threads - 1)))
+
             chosen_provider = 'CPUExecutionProvider'
+            session_providers = [chosen_provider]
             if self.use_gpu:
                 if 'CUDAExecutionProvider' in providers:
                     chosen_provider = 'CUDAExecutionProvider'
-                    # Potential: Add provider options like GPU ID here if needed
-                    # provider_options = [{'device_id': 0}]
+                    cuda_options = {
+                        'device_id': self.gpu_device_id,
+                        # EXHAUSTIVE benchmarks every conv algorithm and dominates start-up latency
+                        'cudnn_conv_algo_search': self.config.get('cudnn_conv_algo_search', 'DEFAULT'),
+                        'do_copy_in_default_stream': True,
+                        # Let cuDNN pick workspace-hungry (faster) conv algorithms; the
+                        # default only from ORT 1.14
+                        'cudnn_conv_use_max_workspace': '1',
+                        # Grow the device arena by exactly what is requested instead of doubling
+                        'arena_extend_strategy': 'kSameAsRequested',
+                    }
+                    if self.config.get('gpu_mem_limit'):
+                        cuda_options['gpu_mem_limit'] = int(self.config['gpu_mem_limit'])
+                    # CPU stays registered for any node CUDA cannot run
+                    session_providers = [(chosen_provider, cuda_options), 'CPUExecutionProvider']
+                    # Host tensors are few and small once inference runs on the GPU
+                    sess_options.enable_cpu_mem_arena = False
+                    if self.config.get('tensorrt') and 'TensorrtExecutionProvider' in providers:
+                        # TensorRT takes every subgraph it supports; CUDA, then CPU, run the rest
+                        chosen_provider = 'TensorrtExecutionProvider'
+                        trt_options = {
+                            'device_id': self.gpu_device_id,
+                            'trt_fp16_enable': True,
+                            # QDQ (int8) models need INT8 kernels enabled to run quantized
+                            'trt_int8_enable': self.config.get('precision') == 'int8',
+                            # Engine builds take minutes; cache them across runs
+                            'trt_engine_cache_enable': True,
+                            'trt_engine_cache_path': self.config.get('tensorrt_cache_dir') or 'trt_cache',
+                        }
+                        session_providers.insert(0, (chosen_provider, trt_options))
                 elif 'DmlExecutionProvider' in providers:
                     chosen_provider = 'DmlExecutionProvider'
+                    session_providers = [chosen_provider]
+                    # DirectML does not support memory pattern optimisation
+                    sess_options.enable_mem_pattern = False
                 else:
                     logger.warning("GPU requested, but neither CUDA nor DirectML provider found. Falling back to CPU.")
             else:
                  logger.info("Using CPU provider for ONNX Runtime.")
 
             logger.info(f"Using ONNX Runtime provider: {chosen_provider}")
-            self.session = ort.InferenceSession(model_path, providers=[chosen_provider], provider_options=provider_options)
+            # Loaded by path: ORT recognises pre-optimized .ort files by their extension.
+            # (Passing bytes with session.use_ort_model_bytes_* is unsafe from Python:
+            # the binding hands ORT a temporary copy that is freed before initialisation.)
+            self.session = ort.InferenceSession(model_path, sess_options=sess_options, providers=session_providers)
+            if chosen_provider not in self.session.get_providers():
+                logger.warning(f"{chosen_provider} failed to initialise; running on {self.session.get_providers()[0]}.")
+                chosen_provider = self.session.get_providers()[0]
 
             # Get model input details
             input_meta = self.session.get_inputs()[0]
             self.input_name = input_meta.name
             self.input_shape = input_meta.shape # e.g., [1, 3, 640, 640]
-            logger.info(f"Model loaded. Input name: {self.input_name}, Expected input shape: {self.input_shape}")
+            if input_meta.type in INPUT_DTYPES:
+                self.input_dtype = INPUT_DTYPES[input_meta.type]
+            else:
+                logger.warning(f"Unsupported model input type {input_meta.type}. Feeding float16.")
+            logger.info(f"Model loaded. Input name: {self.input_name}, Expected input shape: {self.input_shape}, type: {input_meta.type}")
+
+            if chosen_provider in ('TensorrtExecutionProvider', 'CUDAExecutionProvider'):
+                self.use_io_binding = True
+                logger.info("Using IOBinding with device-resident input/output buffers.")
+                if self.config.get('gpu_prefilter', True):
+                    if cupy is not None:
+                        self.gpu_prefilter = True
+                        logger.info("Filtering detection candidates on the GPU with CuPy.")
+                    else:
+                        logger.info("CuPy not installed; detection candidates are filtered on the CPU.")
 
             # Basic check for typical YOLO input shape (adjust if your model differs)
             if len(self.input_shape) != 4 or self.input_shape[0] != 1:
                  logger.warning("Model input shape might not be standard BHWC or BCHW. Ensure preprocessing matches.")
 
+            # Assuming input shape is [batch, channels, height, width]
+            try:
+                self.model_h, self.model_w = int(self.input_shape[2]), int(self.input_shape[3])
+            except (TypeError, ValueError):
+                logger.warning(f"Model input size is dynamic {self.input_shape[2:]}. Using {DEFAULT_INPUT_SIZE}x{DEFAULT_INPUT_SIZE}.")
+                self.model_h = self.model_w = DEFAULT_INPUT_SIZE
+
         except Exception as e:
             logger.error(f"Failed to load ONNX model or create session: {e}", exc_info=True)
             self.session = None # Ensure session is None if loading failed
 
-    def _preprocess(self, frame):
-        """Prepares a frame for the ONNX model. Assumes YOLOv5 style preprocessing."""
-        if self.input_shape is None:
+    def _new_buffers(self):
+        """Allocates one worker's input tensor and, on CUDA, its IOBinding."""
+        shape = (1, 3, self.model_h, self.model_w)
+        if not self.use_io_binding:
+            return _WorkerBuffers(np.empty(shape, dtype=self.input_dtype), None)
+
+        # Keep outputs on the device; ORT then inserts no Memcpy nodes and the
+        # only host transfers are the input upload and one output download
+        io_binding = self.session.io_binding()
+        for output_meta in self.session.get_outputs():
+            io_binding.bind_output(output_meta.name, 'cuda', self.gpu_device_id)
+        if cupy is None:
+            return _WorkerBuffers(np.empty(shape, dtype=self.input_dtype), io_binding)
+        try:
+            # Page-locked host input: preprocessing writes into it and update_inplace
+            # DMAs it straight to the device instead of staging through a pinned
+            # bounce buffer, as a pageable upload does
+            count = int(np.prod(shape))
+            memory = cupy.cuda.alloc_pinned_memory(count * np.dtype(self.input_dtype).itemsize)
+        except Exception as e:
+            logger.warning(f"Could not allocate pinned input memory ({e}). Uploading from pageable memory.")
+            return _WorkerBuffers(np.empty(shape, dtype=self.input_dtype), io_binding)
+        # The array keeps the pinned allocation alive through its buffer reference
+        return _WorkerBuffers(np.frombuffer(memory, self.input_dtype, count).reshape(shape), io_binding)
+
+    def _run_with_io_binding(self, processed_frame, buffers):
+        """Uploads the input into the bound device buffer, runs the model and returns host outputs."""
+        io_binding = buffers.io_binding
+        if buffers.input_ort is None or buffers.input_ort.shape() != list(processed_frame.shape):
+            # Allocated on the first frame (the model may declare symbolic dims), then reused
+            buffers.input_ort = ort.OrtValue.ortvalue_from_numpy(processed_frame, 'cuda', self.gpu_device_id)
+            io_binding.bind_ortvalue_input(self.input_name, buffers.input_ort)
+        else:
+            buffers.input_ort.update_inplace(processed_frame)
+        self.session.run_with_iobinding(io_binding)
+        if self.gpu_prefilter:
+            return [self._prefilter_on_device(io_binding.get_outputs()[0])]
+        return io_binding.copy_outputs_to_cpu()
+
+    def _prefilter_on_device(self, output):
+        """Applies the objectness threshold to a device output and downloads only the survivors.
+
+        Wraps the ORT-owned CUDA buffer in a CuPy array without copying; the result
+        has the usual [1, candidates, 5 + classes] layout, so _postprocess is unchanged.
+        """
+        dtype = np.float16 if output.data_type() == 'tensor(float16)' else np.float32
+        shape = output.shape()
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with cupy.cuda.Device(self.gpu_device_id):
+            memory = cupy.cuda.UnownedMemory(output.data_ptr(), nbytes, output)
+            predictions = cupy.ndarray(shape, dtype=dtype, memptr=cupy.cuda.MemoryPointer(memory, 0))[0]
+            candidates = predictions[predictions[:, 4] > self._conf_thres]
+            return cupy.asnumpy(candidates)[None]
+
+    def _preprocess(self, frame, buffers):
+        """Prepares a BGR or BGRA frame for the ONNX model. Assumes YOLOv5 style preprocessing."""
+        if self.model_h is None:
             logger.error("Cannot preprocess: Model input shape not determined.")
             return None
 
-        # Assuming input shape is [batch, channels, height, width]
-        model_height = self.input_shape[2]
-        model_width = self.input_shape[3]
+        model_height = self.model_h
+        model_width = self.model_w
 
         # 1. Resize and Pad
-        img = frame.copy()
-        img_height, img_width = img.shape[:2]
+        # resize/slicing only read the frame, so no defensive copy is needed
+        img_height, img_width, channels = frame.shape
         # Calculate scale ratio and padding
         r = min(model_height / img_height, model_width / img_width)
         new_unpad_w, new_unpad_h = int(round(img_width * r)), int(round(img_height * r))
         dw, dh = (model_width - new_unpad_w) / 2, (model_height - new_unpad_h) / 2
-
+        top, left = int(round(dh - 0.1)), int(round(dw - 0.1))
+
+        # The frame is resized straight into the centre of a persistent canvas. Its
+        # border only needs (re)filling with 114 when the letterbox geometry changes,
+        # so no padded copy is made per frame.
+        geometry = (top, left, new_unpad_h, new_unpad_w, channels)
+        if buffers.canvas_geometry != geometry:
+            if buffers.canvas is None or buffers.canvas.shape[2] != channels:
+                buffers.canvas = np.empty((model_height, model_width, channels), dtype=np.uint8)
+            buffers.canvas.fill(114)
+            buffers.canvas_geometry = geometry
+        img = buffers.canvas
+        inner = img[top:top + new_unpad_h, left:left + new_unpad_w]
         if (img_width, img_height) != (new_unpad_w, new_unpad_h):
-            img = cv2.resize(img, (new_unpad_w, new_unpad_h), interpolation=cv2.INTER_LINEAR)
-
-        top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
-        left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
-        img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
-
-        # 2. BGR to RGB and HWC to CHW
-        img = img[:, :, ::-1].transpose(2, 0, 1)  # BGR to RGB, HWC to CHW
-        img = np.ascontiguousarray(img)
-
-        # 3. Normalize to [0, 1] and Convert to float16 (as expected by model)
-        img = img.astype(np.float16) / 255.0
-
-        # 4. Add Batch Dimension
-        img = np.expand_dims(img, axis=0)
+            cv2.resize(frame, (new_unpad_w, new_unpad_h), dst=inner, interpolation=cv2.INTER_LINEAR)
+        else:
+            np.copyto(inner, frame)
+
+        # 2. BGR to RGB, HWC to CHW, normalize to [0, 1] and convert to the model's input
+        # type, in one pass. The channel-swapped, transposed view is read strided and
+        # written straight into the batch tensor, so no intermediate array is materialised.
+        # Selecting channels 2, 1, 0 also drops the alpha channel of BGRA screen frames.
+        # The tensor is reused: it is consumed (or uploaded) before the next frame is prepared
+        tensor = buffers.input_tensor
+        rgb_chw = img[:, :, 2::-1].transpose(2, 0, 1)
+        if self.input_dtype == np.uint8:
+            # uint8 models normalise inside the graph; this is a plain reordering copy
+            np.copyto(tensor[0], rgb_chw)
+        elif self.input_dtype == np.float16:
+            np.take(U8_TO_F16, rgb_chw, out=tensor[0])
+        else:
+            np.multiply(rgb_chw, INV_255, out=tensor[0])
 
-        return img, r, (dw, dh) # Return preprocessed image and scaling info
+        return tensor, r, (dw, dh) # Return preprocessed image and scaling info
 
-    def _postprocess(self, outputs, scale_ratio, pad_offset, frame_shape):
+    def _postprocess(self, outputs, scale_ratio, pad_offset, frame_size):
         """Processes the raw model output. Assumes YOLOv5 output format."""
+        frame_h, frame_w = frame_size
         # Output format typically [batch, num_detections, xywh + confidence + num_classes]
         # Example shape: [1, 25200, 85] for COCO (80 classes + 5)
         predictions = outputs[0][0] # Get predictions for the first (only) image in the batch
 
-        # Filter by confidence
-        conf_thres = self.config['confidence_threshold']
-        candidates = predictions[predictions[:, 4] > conf_thres]
-
-        if not candidates.shape[0]:
-            return []
-
-        # Filter by class if specified
-        classes_to_detect = self.config.get('classes_to_detect')
-        if classes_to_detect is not None and len(classes_to_detect) > 0:
-            class_probs = candidates[:, 5:]
-            class_indices = np.argmax(class_probs, axis=1)
-            class_scores = np.max(class_probs, axis=1)
-
-            mask = np.isin(class_indices, classes_to_detect)
-            candidates = candidates[mask]
-            class_indices = class_indices[mask]
-            class_scores = class_scores[mask]
-
-            if not candidates.shape[0]:
-                return []
-            # Overwrite confidence with class-specific score
-            candidates[:, 4] = class_scores
+        # Filter by confidence. Candidates are tracked as row indices and each step
+        # gathers only the columns it reads, so full prediction rows are never copied
+        conf_thres = self._conf_thres
+        objectness = predictions[:, 4]
+        keep = np.flatnonzero(objectness > conf_thres)
+
+        if not keep.size:
+            return NO_DETECTIONS
+        confidences = objectness[keep]
+
+        # Best class per candidate, restricted to the wanted classes if specified
+        if not self._classes_checked:
+            self._check_classes(predictions.shape[1] - 5)
+        wanted = self._classes
+        if wanted is not None:
+            if not wanted.size:
+                return NO_DETECTIONS
+            # Only the wanted classes' columns are read, instead of the full class vector
+            class_probs = predictions[keep[:, None], 5 + wanted]
+            best = np.argmax(class_probs, axis=1)
+            class_indices = wanted[best]
         else:
-            # Use the objectness score and find the best class
-            class_probs = candidates[:, 5:]
-            class_indices = np.argmax(class_probs, axis=1)
-            class_scores = np.max(class_probs, axis=1)
-            # Combine objectness and class score? Or just use objectness? Stick to objectness for now.
-            # candidates[:, 4] = candidates[:, 4] * class_scores # Combined score
-
-        # Convert xywh to xyxy
-        boxes_xywh = candidates[:, :4]
-        boxes_xyxy = np.zeros_like(boxes_xywh)
-        boxes_xyxy[:, 0] = boxes_xywh[:, 0] - boxes_xywh[:, 2] / 2  # x_center - width/2 = x1
-        boxes_xyxy[:, 1] = boxes_xywh[:, 1] - boxes_xywh[:, 3] / 2  # y_center - height/2 = y1
-        boxes_xyxy[:, 2] = boxes_xywh[:, 0] + boxes_xywh[:, 2] / 2  # x_center + width/2 = x2
-        boxes_xyxy[:, 3] = boxes_xywh[:, 1] + boxes_xywh[:, 3] / 2  # y_center + height/2 = y2
-
-        # Adjust coordinates from model input size back to original frame size
+            class_probs = predictions[keep, 5:]
+            best = class_indices = np.argmax(class_probs, axis=1)
+
+        # YOLOv5 score: objectness * best class probability. The probability is read
+        # back at the argmax instead of making a second max() pass over class_probs
+        class_scores = np.take_along_axis(class_probs, best[:, None], axis=1)[:, 0]
+        confidences = np.multiply(confidences, class_scores, dtype=np.float32)
+        mask = confidences > conf_thres
+        if not mask.all():
+            keep = keep[mask]
+            class_indices = class_indices[mask]
+            confidences = confidences[mask]
+            if not keep.size:
+                return NO_DETECTIONS
+
+        # Keep only the most confident candidates in cluttered scenes, bounding the
+        # cost of box decoding and NMS regardless of the candidate count. Ranked on
+        # the final score, after the class filter, so unwanted classes cannot crowd
+        # out wanted ones
+        max_candidates = self._max_candidates
+        if max_candidates is not None and keep.size > max_candidates:
+            top = np.argpartition(confidences, -max_candidates)[-max_candidates:]
+            keep = keep[top]
+            class_indices = class_indices[top]
+            confidences = confidences[top]
+
+        # Convert xywh to xyxy: centre -/+ half size, written straight into a float32
+        # array (float16 lacks the precision for full-frame pixel coordinates)
+        boxes_xywh = predictions[keep, :4]
+        centers = boxes_xywh[:, :2]
+        half_wh = np.multiply(boxes_xywh[:, 2:], 0.5, dtype=np.float32)
+        boxes_xyxy = np.empty((keep.size, 4), dtype=np.float32)
+        np.subtract(centers, half_wh, out=boxes_xyxy[:, :2])  # x1, y1
+        np.add(centers, half_wh, out=boxes_xyxy[:, 2:])       # x2, y2
+
+        # Adjust coordinates from model input size back to original frame size, in place
         # 1. Remove padding
         pad_w, pad_h = pad_offset
-        boxes_xyxy[:, [0, 2]] -= pad_w
-        boxes_xyxy[:, [1, 3]] -= pad_h
+        boxes_xyxy -= np.array((pad_w, pad_h, pad_w, pad_h), dtype=np.float32)
         # 2. Rescale to original size
-        boxes_xyxy /= scale_ratio
+        boxes_xyxy *= np.float32(1.0 / scale_ratio)
 
         # Clip boxes to frame dimensions
-        frame_h, frame_w = frame_shape[:2]
-        boxes_xyxy[:, [0, 2]] = np.clip(boxes_xyxy[:, [0, 2]], 0, frame_w)
-        boxes_xyxy[:, [1, 3]] = np.clip(boxes_xyxy[:, [1, 3]], 0, frame_h)
+        np.clip(boxes_xyxy[:, 0::2], 0, frame_w, out=boxes_xyxy[:, 0::2])
+        np.clip(boxes_xyxy[:, 1::2], 0, frame_h, out=boxes_xyxy[:, 1::2])
 
         # Perform Non-Maximum Suppression (NMS)
-        confidences = candidates[:, 4]
-        nms_thres = self.config['nms_threshold']
-
-        # Use cv2.dnn.NMSBoxes for simplicity
-        # Convert boxes to required format (x, y, w, h)
-        boxes_for_nms = np.zeros_like(boxes_xyxy)
-        boxes_for_nms[:, 0] = boxes_xyxy[:, 0]
-        boxes_for_nms[:, 1] = boxes_xyxy[:, 1]
-        boxes_for_nms[:, 2] = boxes_xyxy[:, 2] - boxes_xyxy[:, 0]
-        boxes_for_nms[:, 3] = boxes_xyxy[:, 3] - boxes_xyxy[:, 1]
-
-        indices = cv2.dnn.NMSBoxes(boxes_for_nms.tolist(), confidences.tolist(), conf_thres, nms_thres)
-
-        detections = []
-        if len(indices) > 0:
-             # If indices is a flat array (possible with OpenCV NMS), flatten it
-            if isinstance(indices, np.ndarray): indices = indices.flatten()
-
-            for i in indices:
-                box = boxes_xyxy[i].astype(int).tolist() # Convert to int list [x1, y1, x2, y2]
-                confidence = float(confidences[i])
-                class_id = int(class_indices[i])
-                detections.append({
-                    'bbox': box,          # [x_min, y_min, x_max, y_max]
-                    'confidence': confidence,
-                    'class_id': class_id
-                    # Add other info like 'label' if you have a class map
-                })
-        return detections
-
-
-    def _processing_loop(self):
+        nms_thres = self._nms_thres
+
+        # cv2.dnn.NMSBoxes runs the greedy suppression loop in C++; it takes float32
+        # (x, y, w, h) arrays directly, so no Python lists are built
+        boxes_for_nms = np.empty(boxes_xyxy.shape, dtype=np.float32)
+        boxes_for_nms[:, :2] = boxes_xyxy[:, :2]
+        np.subtract(boxes_xyxy[:, 2:], boxes_xyxy[:, :2], out=boxes_for_nms[:, 2:])
+        # Class-aware NMS in one call: shifting each class into its own region of the
+        # plane means boxes of different classes never overlap, so never suppress
+        # each other. Only the NMS copy is shifted; kept boxes are read from boxes_xyxy
+        max_wh = np.float32(max(frame_w, frame_h) + 1)
+        boxes_for_nms[:, :2] += (class_indices * max_wh).astype(np.float32)[:, None]
+
+        indices = cv2.dnn.NMSBoxes(boxes_for_nms, confidences, conf_thres, nms_thres)
+
+        if len(indices) == 0:
+            return NO_DETECTIONS
+        # OpenCV may return indices as an (N, 1) array; reshape is a view, flatten would copy
+        indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+        # Round once here so consumers can use the integer pixel coordinates directly
+        return Detections(np.rint(boxes_xyxy[indices]).astype(np.int32),
+                          confidences[indices].astype(np.float32),
+                          class_indices[indices].astype(np.int32))
+
+
+    def _check_classes(self, num_classes):
+        """Drops classes_to_detect ids the model does not have, warning once."""
+        wanted = self._classes
+        if wanted is not None:
+            valid = (wanted >= 0) & (wanted < num_classes)
+            if not valid.all():
+                logger.warning(f"classes_to_detect ids {wanted[~valid].tolist()} are outside the model's "
+                               f"{num_classes} classes and will never match.")
+                self._classes = wanted[valid]
+        self._classes_checked = True
+
+    def _publish(self, result):
+        """Publishes a result unless another worker already published a newer frame."""
+        with self._publish_lock:
+            if result.timestamp < self._last_published:
+                return
+            self._last_published = result.timestamp
+            self.results_queue.put(result)
+
+    def _processing_loop(self, buffers):
         """Continuously fetches frames, preprocesses, infers, and postprocesses."""
         if not self.session:
             logger.error("Processing loop cannot start: ONNX session not initialized.")
             return
 
+        configure_current_thread(self.cpu_affinity, self.thread_priority)
         logger.info("AI processing thread started.")
+        # A single worker publishes in capture order already, so only a pool needs the
+        # ordering check. Capture timestamps are monotonic, so clock steps cannot stall it.
+        publish = self._publish if self.num_workers > 1 else self.results_queue.put
         while not self._stop_event.is_set():
             try:
-                # Get the latest frame from the queue (block briefly if empty)
-                timestamp, frame = self.frame_queue.get(timeout=0.1)
-            except Empty:
-                continue # No frame available, loop again
+                # Block until the latest frame arrives; stop() closes the slot to wake us
+                item = self.frame_queue.get()
             except Exception as e:
-                logger.error(f"Error getting frame from queue: {e}")
+                if self._warn_limiter.ready():
+                    logger.error("Error getting frame from queue: %s", e)
                 time.sleep(0.1)
                 continue
+            if item is None:
+                break # Slot closed by stop()
+            timestamp, frame = item
 
             if frame is None:
-                 logger.warning("Received None frame in processing loop.")
+                 if self._warn_limiter.ready():
+                     logger.warning("Received None frame in processing loop.")
                  continue
 
             start_time = time.perf_counter()
 
             # 1. Preprocess
-            processed_frame, scale_ratio, pad_offset = self._preprocess(frame)
+            processed_frame, scale_ratio, pad_offset = self._preprocess(frame, buffers)
             if processed_frame is None:
                  continue # Skip frame if preprocessing fails
 
@@ -222,73 +507,67 @@ class AIProcessor:
 
             # 2. Inference
             try:
-                outputs = self.session.run(None, {self.input_name: processed_frame})
+                if buffers.io_binding is not None:
+                    outputs = self._run_with_io_binding(processed_frame, buffers)
+                else:
+                    outputs = self.session.run(None, {self.input_name: processed_frame})
             except Exception as e:
-                logger.error(f"ONNX Runtime inference failed: {e}", exc_info=True)
+                if self._warn_limiter.ready():
+                    logger.error("ONNX Runtime inference failed: %s", e, exc_info=True)
                 continue # Skip frame if inference fails
 
             inference_end_time = time.perf_counter()
 
             # 3. Postprocess
-            detections = self._postprocess(outputs, scale_ratio, pad_offset, frame.shape)
+            detections = self._postprocess(outputs, scale_ratio, pad_offset, frame.shape[:2])
             postprocess_end_time = time.perf_counter()
 
-            # Timing logs (optional)
-            t_preprocess = (preprocess_end_time - start_time) * 1000
-            t_inference = (inference_end_time - preprocess_end_time) * 1000
-            t_postprocess = (postprocess_end_time - inference_end_time) * 1000
-            t_total = (postprocess_end_time - start_time) * 1000
-            logger.debug(f"Processing Time: Total={t_total:.1f}ms (Pre={t_preprocess:.1f} + Infer={t_inference:.1f} + Post={t_postprocess:.1f}), Detections: {len(detections)}")
-
-            # 4. Put results into the output queue
-            # Combine original frame and detections
-            result_data = {
-                'timestamp': timestamp,
-                'frame': frame, # Pass the original frame along
-                'detections': detections
-            }
-            try:
-                self.results_queue.put(result_data, timeout=0.1)
-            except Full:
-                # If results queue is full, maybe the display loop is stuck?
-                # Log a warning, maybe drop older results?
-                logger.warning("Results queue is full. Display might be lagging.")
-                try:
-                     self.results_queue.get_nowait() # Drop oldest result
-                     self.results_queue.put_nowait(result_data)
-                except Exception as e_inner:
-                     logger.warning(f"Error managing full results queue: {e_inner}")
-            except Exception as e:
-                 logger.error(f"Error putting results in queue: {e}")
+            # Timing logs (optional); only computed and formatted when DEBUG is enabled
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Processing Time: Total=%.1fms (Pre=%.1f + Infer=%.1f + Post=%.1f), Detections: %d",
+                             (postprocess_end_time - start_time) * 1000,
+                             (preprocess_end_time - start_time) * 1000,
+                             (inference_end_time - preprocess_end_time) * 1000,
+                             (postprocess_end_time - inference_end_time) * 1000,
+                             len(detections))
+
+            # 4. Publish results, replacing any result the display has not picked up yet
+            # Pass the original frame along with its detections
+            publish(FrameResult(timestamp, frame, detections))
 
 
         logger.info("AI processing thread finished.")
 
 
     def start(self):
-        """Starts the processing thread."""
-        if self._processing_thread is not None:
+        """Starts the processing thread(s)."""
+        if self._processing_threads:
             logger.warning("Processing thread already running.")
             return
         if not self.session:
             logger.error("Cannot start processing thread: Model not loaded.")
             return
 
-        logger.info("Starting AI processing thread...")
+        logger.info(f"Starting AI processing thread{'s' if self.num_workers > 1 else ''} ({self.num_workers})...")
         self._stop_event.clear()
-        self._processing_thread = threading.Thread(target=self._processing_loop, name="AIProcessorThread")
-        self._processing_thread.daemon = True
-        self._processing_thread.start()
+        for i in range(self.num_workers):
+            name = "AIProcessorThread" if self.num_workers == 1 else f"AIProcessorThread-{i}"
+            thread = threading.Thread(target=self._processing_loop, args=(self._new_buffers(),), name=name)
+            thread.daemon = True
+            thread.start()
+            self._processing_threads.append(thread)
 
     def stop(self):
-        """Signals the processing thread to stop."""
-        if self._processing_thread is None:
+        """Signals the processing thread(s) to stop."""
+        if not self._processing_threads:
             logger.warning("Processing thread not running.")
             return
         logger.info("Stopping AI processing thread...")
         self._stop_event.set()
-        self._processing_thread.join(timeout=2)
-        if self._processing_thread.is_alive():
-             logger.warning("AI Processing thread did not stop gracefully.")
-        self._processing_thread = None
+        self.frame_queue.close() # Wakes every worker immediately instead of at its next poll
+        for thread in self._processing_threads:
+            thread.join(timeout=2)
+            if thread.is_alive():
+                 logger.warning(f"AI Processing thread {thread.name} did not stop gracefully.")
+        self._processing_threads = []
         logger.info("AI processing thread stopped.") 
\ No newline at end of file
@@ -0,0 +1,93 @@
+import argparse
+import glob
+import os
+import sys
+
+import cv2
+import numpy as np
+
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                          QuantType, quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+except ImportError as e:
+    sys.exit(f"onnxruntime's quantization tools are required ({e}): pip install onnxruntime onnx sympy")
+
+IMAGE_EXTENSIONS = ('*.jpg', '*.jpeg', '*.png', '*.bmp')
+
+def letterbox_tensor(image, size):
+    """Letterboxes a BGR image exactly like AIProcessor._preprocess, as a float32 NCHW tensor."""
+    height, width = image.shape[:2]
+    r = min(size / height, size / width)
+    new_w, new_h = int(round(width * r)), int(round(height * r))
+    top, left = int(round((size - new_h) / 2 - 0.1)), int(round((size - new_w) / 2 - 0.1))
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    return (canvas[:, :, ::-1].transpose(2, 0, 1)[None] / np.float32(255)).astype(np.float32)
+
+class FrameCalibrationReader(CalibrationDataReader):
+    """Feeds letterboxed calibration images to the ONNX Runtime calibrator."""
+    def __init__(self, image_paths, input_name, size):
+        self._paths = iter(image_paths)
+        self._input_name = input_name
+        self._size = size
+
+    def get_next(self):
+        for path in self._paths:
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is None:
+                print(f"  Skipping unreadable image: {path}")
+                continue
+            return {self._input_name: letterbox_tensor(image, self._size)}
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Statically quantize an FP32 YOLO ONNX model to INT8 (QDQ format).")
+    parser.add_argument('model', help="FP32 ONNX model (FP16 exports cannot be quantized; export in FP32)")
+    parser.add_argument('calibration_dir', help="Directory of representative frames (e.g. screenshots of the target)")
+    parser.add_argument('-o', '--output', help="Output path (default: <model>.int8.onnx)")
+    parser.add_argument('--size', type=int, help="Model input size, for models with a dynamic one (default: from the model, else 640)")
+    parser.add_argument('--max-images', type=int, default=200, help="Calibration images to use (default: 200)")
+    args = parser.parse_args()
+
+    image_paths = sorted(p for ext in IMAGE_EXTENSIONS for p in glob.glob(os.path.join(args.calibration_dir, ext)))
+    image_paths = image_paths[:args.max_images]
+    if not image_paths:
+        sys.exit(f"No calibration images found in {args.calibration_dir}")
+    output_path = args.output or os.path.splitext(args.model)[0] + '.int8.onnx'
+
+    # Input name and size come from the model itself
+    input_meta = ort.InferenceSession(args.model, providers=['CPUExecutionProvider']).get_inputs()[0]
+    size = args.size
+    if size is None:
+        size = input_meta.shape[2] if isinstance(input_meta.shape[2], int) else 640
+    print(f"Model input '{input_meta.name}', calibrating at {size}x{size}")
+
+    # Shape inference and graph cleanup first, as ONNX Runtime recommends before static quantization
+    prepared_path = os.path.splitext(output_path)[0] + '.prep.onnx'
+    print(f"Preparing {args.model}...")
+    quant_pre_process(args.model, prepared_path)
+
+    print(f"Calibrating on {len(image_paths)} images...")
+    try:
+        quantize_static(
+            prepared_path,
+            output_path,
+            FrameCalibrationReader(image_paths, input_meta.name, size),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            # Symmetric signed int8 throughout: the only form TensorRT's explicit Q/DQ
+            # mode accepts, and still served by the CPU provider's VNNI kernels
+            activation_type=QuantType.QInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+            extra_options={'ActivationSymmetric': True, 'WeightSymmetric': True},
+        )
+    finally:
+        os.remove(prepared_path)
+    print(f"Saved INT8 model to {output_path}")
+    print("Set ai.int8_model_path to this file and ai.precision to 'int8' in config.yaml.")
+
+if __name__ == "__main__":
+    main()
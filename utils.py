@@ -1,7 +1,14 @@
 # utils.py
+import os
+import sys
 import time
+import threading
+import ctypes
+import cv2
+import numpy as np
 import yaml
 import logging
+from queue import Empty
 
 # Basic logging setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s')
@@ -21,23 +28,255 @@ def load_config(path="config.yaml"):
         logger.error(f"Error loading configuration: {e}")
         return None
 
+def configure_opencv(num_threads=None):
+    """Bounds OpenCV's internal thread pool and logs its parallel/SIMD build features.
+
+    OpenCV defaults to one worker per core, which oversubscribes the CPU against
+    the capture and inference threads. None keeps OpenCV's default.
+    """
+    if num_threads is not None:
+        cv2.setNumThreads(int(num_threads))
+    build_features = {}
+    for line in cv2.getBuildInformation().splitlines():
+        key, _, value = line.strip().partition(':')
+        if key in ('Parallel framework', 'Intel IPP'):
+            build_features[key] = value.strip()
+    logger.info(f"OpenCV {cv2.__version__}: {cv2.getNumThreads()} threads, "
+                f"parallel framework: {build_features.get('Parallel framework', 'unknown')}, "
+                f"Intel IPP: {build_features.get('Intel IPP', 'NO')}")
+
+# Thread priority levels: (Windows SetThreadPriority value, POSIX nice value)
+_THREAD_PRIORITIES = {
+    'above_normal': (1, -5),
+    'highest': (2, -10),
+}
+
+def configure_current_thread(cpu_cores=None, priority=None):
+    """Pins the calling thread to cpu_cores and optionally raises its priority.
+
+    Must be called from inside the thread being configured. cpu_cores is an
+    iterable of core indices (None leaves affinity alone); priority is one of
+    'above_normal' or 'highest' (None leaves it alone). Failures, such as missing
+    privileges or an unsupported platform, are logged and otherwise ignored.
+    """
+    name = threading.current_thread().name
+    if cpu_cores:
+        cores = set(cpu_cores)
+        try:
+            if sys.platform == 'win32':
+                mask = 0
+                for core in cores:
+                    mask |= 1 << core
+                kernel32 = ctypes.windll.kernel32
+                if not kernel32.SetThreadAffinityMask(kernel32.GetCurrentThread(), mask):
+                    raise ctypes.WinError()
+            elif hasattr(os, 'sched_setaffinity'):
+                os.sched_setaffinity(0, cores) # pid 0 is the calling thread on Linux
+            else:
+                raise OSError("thread affinity is not supported on this platform")
+            logger.info(f"Pinned {name} to CPU cores {sorted(cores)}")
+        except Exception as e:
+            logger.warning(f"Could not pin {name} to CPU cores {sorted(cores)}: {e}")
+
+    if priority:
+        if priority not in _THREAD_PRIORITIES:
+            logger.warning(f"Unknown thread priority '{priority}' for {name}. Ignoring.")
+            return
+        win_priority, nice_value = _THREAD_PRIORITIES[priority]
+        try:
+            if sys.platform == 'win32':
+                kernel32 = ctypes.windll.kernel32
+                if not kernel32.SetThreadPriority(kernel32.GetCurrentThread(), win_priority):
+                    raise ctypes.WinError()
+            elif sys.platform.startswith('linux'):
+                # On Linux each thread has its own nice value, addressed by native thread id
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice_value)
+            else:
+                # Elsewhere (e.g. macOS) setpriority addresses whole processes, not threads
+                raise OSError("per-thread priority is not supported on this platform")
+            logger.info(f"Raised {name} priority to {priority}")
+        except Exception as e:
+            logger.warning(f"Could not raise {name} priority to {priority}: {e}")
+
+# Win32 waitable timer constants
+_CREATE_WAITABLE_TIMER_HIGH_RESOLUTION = 0x00000002
+_TIMER_ALL_ACCESS = 0x1F0003
+_INFINITE = 0xFFFFFFFF
+
+class HighResolutionTimer:
+    """Sleeps with sub-millisecond precision on Windows.
+
+    time.sleep() on Windows rounds up to the ~15.6 ms system tick unless the
+    global timer resolution is raised (which costs battery system-wide). A
+    high-resolution waitable timer (Windows 10 1803+) avoids both. Elsewhere, or
+    if the timer cannot be created, this falls back to time.sleep(). Use one
+    instance per thread and close() it when done.
+    """
+    def __init__(self):
+        self._handle = None
+        if sys.platform != 'win32':
+            return
+        from ctypes import wintypes
+        self._kernel32 = ctypes.windll.kernel32
+        self._kernel32.CreateWaitableTimerExW.restype = wintypes.HANDLE
+        self._kernel32.CreateWaitableTimerExW.argtypes = [ctypes.c_void_p, wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD]
+        self._kernel32.SetWaitableTimer.argtypes = [wintypes.HANDLE, ctypes.POINTER(ctypes.c_longlong), wintypes.LONG,
+                                                    ctypes.c_void_p, ctypes.c_void_p, wintypes.BOOL]
+        self._kernel32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+        self._kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        handle = self._kernel32.CreateWaitableTimerExW(None, None, _CREATE_WAITABLE_TIMER_HIGH_RESOLUTION, _TIMER_ALL_ACCESS)
+        if handle:
+            self._handle = handle
+            self._due = ctypes.c_longlong(0)
+        else:
+            logger.warning("High-resolution waitable timer unavailable, falling back to time.sleep().")
+
+    def sleep_ns(self, duration_ns):
+        """Blocks the calling thread for duration_ns nanoseconds."""
+        if self._handle is None:
+            time.sleep(duration_ns / 1e9)
+            return
+        # Negative due time is relative, in 100 ns units
+        self._due.value = -(duration_ns // 100)
+        self._kernel32.SetWaitableTimer(self._handle, ctypes.byref(self._due), 0, None, None, False)
+        self._kernel32.WaitForSingleObject(self._handle, _INFINITE)
+
+    def close(self):
+        """Releases the timer handle."""
+        if self._handle is not None:
+            self._kernel32.CloseHandle(self._handle)
+            self._handle = None
+
 class FPSCounter:
     """A simple class to calculate and display FPS."""
+    # The clock is only read every CHECK_INTERVAL frames (a power of two)
+    CHECK_INTERVAL = 16
+
     def __init__(self):
-        self._start_time = time.time()
+        self._start_ns = time.monotonic_ns()
         self._frame_count = 0
         self._fps = 0.0
 
     def update(self):
         """Call this once per frame."""
         self._frame_count += 1
-        elapsed_time = time.time() - self._start_time
-        if elapsed_time >= 1.0:
-            self._fps = self._frame_count / elapsed_time
-            self._start_time = time.time()
+        if self._frame_count & (self.CHECK_INTERVAL - 1):
+            return self._fps
+        now = time.monotonic_ns()
+        elapsed_ns = now - self._start_ns
+        if elapsed_ns >= 1_000_000_000:
+            self._fps = self._frame_count * 1e9 / elapsed_ns
+            self._start_ns = now
             self._frame_count = 0
         return self._fps
 
     def get_fps(self):
         """Get the current calculated FPS."""
-        return self._fps 
\ No newline at end of file
+        return self._fps 
+
+class RateLimiter:
+    """Lets an action through at most once per interval, e.g. a warning that could fire every frame."""
+    __slots__ = ('interval', '_last')
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._last = float('-inf')
+
+    def ready(self):
+        """Returns True (and restarts the interval) if the action may run now."""
+        now = time.monotonic()
+        if now - self._last < self.interval:
+            return False
+        self._last = now
+        return True
+
+class LatestSlot:
+    """A single-slot buffer that only ever holds the most recent item.
+
+    put() overwrites any item that has not been consumed yet, so producers never
+    block and consumers always receive the freshest data. get() mirrors
+    queue.Queue.get() and raises queue.Empty on timeout. Once close() is called,
+    get() returns None immediately and further puts are ignored, so the close
+    cannot be overwritten by a late producer. Several consumers may wait at
+    once; each item is handed to exactly one of them.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._item = None
+        self._closed = False
+
+    def put(self, item):
+        """Stores item, replacing any unconsumed one."""
+        with self._lock:
+            if self._closed:
+                return
+            self._item = item
+            self._event.set()
+
+    def get(self, timeout=None):
+        """Waits for an item and removes it from the slot. Returns None once closed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self._event.wait(remaining):
+                raise Empty
+            with self._lock:
+                if self._closed:
+                    return None
+                if self._event.is_set(): # Another consumer may have taken the item first
+                    item = self._item
+                    self._item = None
+                    self._event.clear()
+                    return item
+
+    def close(self):
+        """Wakes all current and future consumers with None."""
+        with self._lock:
+            self._closed = True
+            self._item = None
+            self._event.set()
+
+
+class FramePool:
+    """Pre-allocated frame buffers, each reused only once no consumer holds it.
+
+    Producers decode into a free buffer instead of allocating a new frame, so
+    steady-state capture does no allocation. A buffer is free when the pool holds
+    the only reference to it: every slot, worker, drawer and display has dropped
+    the frame and any views of it. Consumers need no explicit release, and a slot
+    dropping an unconsumed frame frees it too. When every buffer is in use the
+    pool grows rather than overwrite a frame that is still being read.
+    """
+    def __init__(self, size):
+        self.size = size
+        self._buffers = []
+        self._free_refcount = self._measure_free_refcount()
+
+    @staticmethod
+    def _measure_free_refcount():
+        """Returns getrefcount of a buffer only the pool holds, seen from next_buffer's loop.
+
+        Measured rather than hard-coded: the count includes interpreter-internal
+        references (list, loop variable, call argument) that vary between CPython
+        versions, e.g. 3.14 borrows some of them.
+        """
+        buffers = [np.empty(0, dtype=np.uint8)]
+        for buffer in buffers:
+            return sys.getrefcount(buffer)
+
+    def next_buffer(self, shape, dtype=np.uint8):
+        """Returns a free buffer, (re)allocating the pool if the frame shape changed."""
+        buffers = self._buffers
+        if not buffers or buffers[0].shape != shape or buffers[0].dtype != dtype:
+            buffers = self._buffers = [np.empty(shape, dtype=dtype) for _ in range(self.size)]
+        # Only the owning producer hands buffers out, and a busy buffer's count can
+        # only fall, so a buffer seen as free here cannot still be in use
+        free_refcount = self._free_refcount
+        for buffer in buffers:
+            if sys.getrefcount(buffer) == free_refcount:
+                return buffer
+        buffer = np.empty(shape, dtype=dtype)
+        buffers.append(buffer)
+        logger.debug(f"All {len(buffers) - 1} frame buffers in use; grew the pool to {len(buffers)}.")
+        return buffer